@@ -0,0 +1,180 @@
+"""Benchmark of the worker startup overhead of `gem_example` pipelines.
+
+Each measurement runs in a fresh Python interpreter, just like a newly started Ray worker would:
+  * import overhead of each `gem_example` module, i.e. its import time once `eo-learn` and `eo-grow` are imported,
+  * construction of the catalog pipeline and of its workflow, cold (first call) and warm (second call),
+  * latency of the first and the second catalog query task of a worker, each of them unpickling the workflow, as Ray
+    workers do, and executing `QueryCatalogAPI` against a local mocked Sentinel Hub service. The first task also
+    fetches the OAuth token, which later tasks of the same worker reuse. The benchmark fails if they fetch it again.
+
+Median times are compared with the baseline in `startup_baseline.json` and the script exits with a non-zero code if
+any of them is slower than `tolerance * baseline + slack`:
+
+    python benchmarks/startup.py
+
+The baseline is overwritten with the current measurements with
+
+    python benchmarks/startup.py --record
+
+The baseline was recorded with dependencies pinned in `benchmarks/requirements.txt`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+PROJECT_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+BASELINE_PATH = os.path.join(BENCHMARKS_FOLDER, "startup_baseline.json")
+CATALOG_CONFIG_PATH = os.path.join(PROJECT_FOLDER, "config_files", "continuous_monitoring", "01_update_catalog.json")
+
+DEPENDENCIES = ["eolearn.core", "eolearn.features", "eolearn.io", "eogrow.core.pipeline", "eogrow.pipelines.download"]
+
+MODULES = [
+    "gem_example.tasks.aggregation",
+    "gem_example.tasks.data_availability",
+    "gem_example.tasks.download",
+    "gem_example.tasks.processing",
+    "gem_example.pipelines.catalog",
+    "gem_example.pipelines.incremental_download",
+    "gem_example.pipelines.processing",
+]
+
+IMPORT_SNIPPET = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+{dependency_imports}
+dependencies_time = time.perf_counter() - start
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"dependencies": dependencies_time, "overhead": time.perf_counter() - start}}))
+"""
+
+WORKER_SNIPPET = """
+import json, os, pickle, tempfile, threading, time, warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+warnings.simplefilter("ignore")
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+token_requests = []
+
+class MockedServiceHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/oauth/token"):
+            token_requests.append(self.path)
+            response = {{"access_token": "token", "token_type": "Bearer", "expires_in": 3600}}
+        else:
+            response = {{"features": [{{"properties": {{"datetime": "2022-01-01T10:00:00Z"}}}}], "context": {{}}}}
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), MockedServiceHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+from eogrow.core.config import interpret_config_from_path
+from eolearn.core import EOPatch
+from sentinelhub import CRS, BBox
+from gem_example.pipelines.catalog import CatalogPipeline
+from gem_example.tasks.data_availability import QueryCatalogAPI
+
+times = {{}}
+raw_config = interpret_config_from_path({config_path!r})
+raw_config["storage"]["project_folder"] = tempfile.mkdtemp()
+
+start = time.perf_counter()
+pipeline = CatalogPipeline.from_raw_config(raw_config)
+times["pipeline construction"] = time.perf_counter() - start
+
+service_url = f"http://127.0.0.1:{{server.server_port}}"
+pipeline.sh_config.sh_base_url = pipeline.sh_config.sh_auth_base_url = service_url
+pipeline.sh_config.sh_client_id, pipeline.sh_config.sh_client_secret = "client-id", "client-secret"
+
+for label in ["cold", "warm"]:
+    start = time.perf_counter()
+    workflow = pipeline.build_workflow()
+    times[f"workflow construction ({{label}})"] = time.perf_counter() - start
+serialized_workflow = pickle.dumps(workflow)
+
+for label in ["first", "second"]:
+    start = time.perf_counter()
+    task_workflow = pickle.loads(serialized_workflow)
+    for node in task_workflow.get_nodes():
+        if isinstance(node.task, QueryCatalogAPI):
+            node.task.execute(EOPatch(bbox=BBox((14.0, 46.0, 14.1, 46.1), CRS.WGS84)))
+    times[f"catalog query task ({{label}})"] = time.perf_counter() - start
+
+assert len(token_requests) == 1, f"Tasks of a worker fetched {{len(token_requests)}} OAuth tokens instead of one"
+print(json.dumps(times))
+"""
+
+
+def _run_snippet(snippet: str, repeats: int) -> Dict[str, float]:
+    """Runs the snippet in fresh interpreters and returns medians of the times it reports"""
+    runs: List[Dict[str, float]] = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", snippet], capture_output=True, text=True, check=True, cwd=PROJECT_FOLDER
+        )
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+
+
+def measure(repeats: int) -> Dict[str, float]:
+    """Collects all measurements, which are compared against the baseline"""
+    dependency_imports = "\n".join(f"import {dependency}" for dependency in DEPENDENCIES)
+
+    measurements: Dict[str, float] = {}
+    for module in MODULES:
+        times = _run_snippet(IMPORT_SNIPPET.format(dependency_imports=dependency_imports, module=module), repeats)
+        print(f"import {module}: {times['overhead']:.4f} s (dependencies: {times['dependencies']:.3f} s)")
+        measurements[f"import {module}"] = times["overhead"]
+
+    for name, seconds in _run_snippet(WORKER_SNIPPET.format(config_path=CATALOG_CONFIG_PATH), repeats).items():
+        print(f"{name}: {seconds:.4f} s")
+        measurements[name] = seconds
+
+    return measurements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5, help="Number of fresh interpreters per measurement")
+    parser.add_argument("--record", action="store_true", help="Overwrite the baseline with the current measurements")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed relative slowdown against the baseline")
+    parser.add_argument("--slack", type=float, default=0.01, help="Allowed absolute slowdown against the baseline in s")
+    args = parser.parse_args()
+
+    measurements = measure(args.repeats)
+
+    if args.record:
+        with open(BASELINE_PATH, "w") as baseline_file:
+            json.dump({name: round(seconds, 4) for name, seconds in measurements.items()}, baseline_file, indent=2)
+            baseline_file.write("\n")
+        return
+
+    with open(BASELINE_PATH) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = [
+        f"{name} ({seconds:.4f} s, baseline {baseline[name]:.4f} s)"
+        for name, seconds in measurements.items()
+        if name in baseline and seconds > args.tolerance * baseline[name] + args.slack
+    ]
+    if regressions:
+        sys.exit(f"Startup times regressed for: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
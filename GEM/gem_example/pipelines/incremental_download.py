@@ -1,16 +1,25 @@
 import datetime as dt
 import os
 from datetime import datetime
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+from fs import path as fs_path
 from pydantic import Field
 
 from eogrow.pipelines.download import BaseDownloadPipeline, CommonDownloadFields, SessionLoaderType
 from eogrow.types import ExecKwargs, PatchList
-from eogrow.utils.types import Feature, FeatureSpec, Path
+from eogrow.utils.types import Feature, FeatureSpec
 from eolearn.core import EONode, EOPatch, EOWorkflow, FeatureType
 from eolearn.io import SentinelHubEvalscriptTask
-from sentinelhub import MimeType, MosaickingOrder, read_data
+from sentinelhub import MimeType, MosaickingOrder, parse_time, read_data
+
+from ..tasks.download import (
+    CHECKPOINT_KEY,
+    SEGMENTS_FOLDER,
+    CheckpointedDownloadTask,
+    get_segments_folder,
+    load_committed_checkpoints,
+)
 
 
 def calculate_time_period(
@@ -30,10 +39,28 @@ def calculate_time_period(
     raise ValueError("No new timestamps.")
 
 
+def calculate_time_segments(
+    existing_timestamps: List[datetime],
+    availability_timestamps: List[datetime],
+    timestamps_per_segment: Optional[int] = None,
+) -> List[Tuple[datetime, datetime]]:
+    """Split the time period of available, but not yet existing timestamps into consecutive segments, each
+    spanning at most `timestamps_per_segment` available timestamps"""
+    start, end = calculate_time_period(existing_timestamps, availability_timestamps)
+    if timestamps_per_segment is None:
+        return [(start, end)]
+
+    new_timestamps = sorted(ts for ts in availability_timestamps if start <= ts <= end)
+    return [
+        (new_timestamps[idx], new_timestamps[min(idx + timestamps_per_segment, len(new_timestamps)) - 1])
+        for idx in range(0, len(new_timestamps), timestamps_per_segment)
+    ]
+
+
 class IncrementalDownloadPipeline(BaseDownloadPipeline):
     class Schema(BaseDownloadPipeline.Schema, CommonDownloadFields):
         features: List[Feature] = Field(description="Features to construct from the evalscript")
-        evalscript_path: Path
+        evalscript_path: str
         catalog_folder_key: str = Field(
             description="The storage manager key pointing to the EOPatches with data availability info."
         )
@@ -44,6 +71,13 @@ class IncrementalDownloadPipeline(BaseDownloadPipeline):
         mosaicking_order: Optional[MosaickingOrder] = Field(
             description="The mosaicking order used by Sentinel Hub service. Default is mostRecent"
         )
+        timestamps_per_segment: Optional[int] = Field(
+            gt=0,
+            description=(
+                "Maximal number of available timestamps downloaded and committed to storage at once. A failed"
+                " execution resumes from the last committed segment. By default the whole time period is one segment."
+            ),
+        )
 
     config: Schema
 
@@ -71,13 +105,45 @@ class IncrementalDownloadPipeline(BaseDownloadPipeline):
             upsampling=self.config.resampling_type,
             session_loader=session_loader,
         )
-        return EONode(download_task)
+
+        download_node = EONode(download_task)
+        output_node = download_node
+        if self.config.postprocessing:
+            output_node = self.get_postprocessing_node(self.config.postprocessing, download_node)
+
+        checkpointed_download_task = CheckpointedDownloadTask(
+            download_node,
+            output_node,
+            path=self.storage.get_folder(self.config.output_folder_key),
+            filesystem=self.storage.filesystem,
+            features=self._get_output_features(),
+            compress_level=self.config.compress_level,
+        )
+        return EONode(checkpointed_download_task)
+
+    def build_workflow(self, session_loader: SessionLoaderType) -> EOWorkflow:
+        """The download node commits each time segment to storage itself, so no saving node is appended"""
+        download_node = self._get_download_node(session_loader)
+        self.download_node_uid = download_node.uid
+        return EOWorkflow([download_node])
 
     def __init__(self, *args: Any, **kwargs: Any):
         super().__init__(*args, **kwargs)
-        self.time_periods = {}
+        self.time_segments: Dict[str, Tuple[List[Tuple[datetime, datetime]], bool]] = {}
 
-    def _get_time_period(self, eopatch_name: str) -> Tuple[datetime, datetime]:
+    def run_procedure(self) -> Tuple[List[str], List[str]]:
+        """Runs the download and afterwards removes the staging folder of segments if no EOPatch is left in it"""
+        finished, failed = super().run_procedure()
+
+        filesystem = self.storage.filesystem
+        staging_folder = fs_path.join(self.storage.get_folder(self.config.output_folder_key), SEGMENTS_FOLDER)
+        if filesystem.exists(staging_folder) and filesystem.isempty(staging_folder):
+            filesystem.removedir(staging_folder)
+
+        return finished, failed
+
+    def _get_time_segments(self, eopatch_name: str) -> Tuple[List[Tuple[datetime, datetime]], bool]:
+        """Calculates time segments that still have to be downloaded and whether they continue a committed period"""
         fs = self.storage.filesystem
         existing_folder = self.storage.get_folder(self.config.output_folder_key)
         catalog_folder = self.storage.get_folder(self.config.catalog_folder_key)
@@ -85,26 +151,47 @@ class IncrementalDownloadPipeline(BaseDownloadPipeline):
         catalog_eop_path = os.path.join(catalog_folder, eopatch_name)
         catalog_ts = EOPatch.load(catalog_eop_path, filesystem=fs).timestamp
 
+        segments_folder = get_segments_folder(existing_folder, eopatch_name)
+        checkpoints = load_committed_checkpoints(fs, segments_folder) if fs.exists(segments_folder) else []
+        if checkpoints:
+            committed_until = parse_time(checkpoints[-1]["committed_until"], force_datetime=True)
+            try:
+                time_segments = calculate_time_segments(
+                    [committed_until], catalog_ts, self.config.timestamps_per_segment
+                )
+            except ValueError:
+                time_segments = []  # all segments are committed, only joining them into the EOPatch is left
+            return time_segments, True
+
         existing_ts = []
         if fs.exists(existing_eop_path):
-            existing_ts = EOPatch.load(existing_eop_path, filesystem=self.storage.filesystem).timestamp
-
-        return calculate_time_period(existing_ts, catalog_ts)
+            existing_eop = EOPatch.load(
+                existing_eop_path, features=[FeatureType.TIMESTAMP, FeatureType.META_INFO], filesystem=fs
+            )
+            checkpoint = existing_eop.meta_info.get(CHECKPOINT_KEY)
+            if checkpoint is None:
+                existing_ts = existing_eop.timestamp
+            else:
+                existing_ts = [parse_time(checkpoint["time_period"][1], force_datetime=True)]
+
+        time_segments = calculate_time_segments(existing_ts, catalog_ts, self.config.timestamps_per_segment)
+        return time_segments, False
 
     def filter_patch_list(self, patch_list: PatchList) -> PatchList:
-        """EOPatches are filtered according to existence of specified output features"""
+        """EOPatches are filtered according to whether they have any time segments left to download or commit. Time
+        segments of the remaining EOPatches are calculated and stored for execution"""
         filtered_patch_list: PatchList = []
         for name, bbox in patch_list:
             try:
-                time_period = self._get_time_period(name)
-                self.time_periods[name] = time_period
+                self.time_segments[name] = self._get_time_segments(name)
                 filtered_patch_list.append((name, bbox))
             except ValueError:
                 continue
         return filtered_patch_list
 
     def get_execution_arguments(self, workflow: EOWorkflow, patch_list: PatchList) -> ExecKwargs:
-        """Adds required bbox and time_interval parameters for input task to the base execution arguments
+        """Adds the EOPatch name, bbox, time segments left to download, and whether to resume after already committed
+        segments, to the base execution arguments of the download node
 
         :param workflow: EOWorkflow used to download images
         """
@@ -116,6 +203,12 @@ class IncrementalDownloadPipeline(BaseDownloadPipeline):
             return exec_args
 
         for name, bbox in patch_list:
-            exec_args[name][download_node] = {"bbox": bbox, "time_interval": self.time_periods[name]}
+            time_segments, resume = self.time_segments[name]
+            exec_args[name][download_node] = {
+                "eopatch_folder": name,
+                "bbox": bbox,
+                "time_segments": time_segments,
+                "resume": resume,
+            }
 
         return exec_args
@@ -0,0 +1,188 @@
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import fs
+import numpy as np
+from fs.base import FS
+
+from eogrow.utils.types import FeatureSpec
+from eolearn.core import (
+    EONode,
+    EOPatch,
+    EOTask,
+    EOWorkflow,
+    FeatureType,
+    LoadTask,
+    OutputTask,
+    OverwritePermission,
+    SaveTask,
+)
+from eolearn.core.utils.fs import pickle_fs, unpickle_fs
+from sentinelhub import BBox, parse_time, serialize_time
+
+CHECKPOINT_KEY = "DOWNLOAD_CHECKPOINT"
+SEGMENTS_FOLDER = "_segments"
+
+
+def make_checkpoint(time_period: Tuple[datetime, datetime], committed_until: datetime) -> Dict[str, Any]:
+    """Creates a JSON-serializable record of which part of the time period is already committed to storage"""
+    return {
+        "time_period": [serialize_time(time_period[0]), serialize_time(time_period[1])],
+        "committed_until": serialize_time(committed_until),
+    }
+
+
+def get_segments_folder(folder: str, eopatch_name: str) -> str:
+    """Provides the folder in which segments of an EOPatch are staged until the whole time period is downloaded"""
+    return fs.path.join(folder, SEGMENTS_FOLDER, eopatch_name)
+
+
+def get_segment_name(index: int) -> str:
+    return f"segment_{index:04d}"
+
+
+def load_committed_checkpoints(filesystem: FS, segments_folder: str) -> List[Dict[str, Any]]:
+    """Loads checkpoints of staged segments in order, up to the first segment that was not committed"""
+    checkpoints: List[Dict[str, Any]] = []
+    while True:
+        segment_path = fs.path.join(segments_folder, get_segment_name(len(checkpoints)))
+        if not filesystem.exists(segment_path):
+            return checkpoints
+
+        meta_info = EOPatch.load(segment_path, features=[FeatureType.META_INFO], filesystem=filesystem).meta_info
+        if CHECKPOINT_KEY not in meta_info:
+            return checkpoints
+        checkpoints.append(meta_info[CHECKPOINT_KEY])
+
+
+class CheckpointedDownloadTask(EOTask):
+    """Downloads a time period in consecutive segments and commits each segment to storage once it completes
+
+    Each segment is downloaded and post-processed by the nodes from `download_node` to `output_node` and staged as a
+    separate EOPatch. Its data is saved first and the checkpoint in meta-info is saved only afterwards, so the
+    checkpoint is the commit marker of the segment. Once all segments are committed they are concatenated into the
+    output EOPatch and the staged segments are removed. Every segment is therefore written to storage exactly twice,
+    regardless of the number of segments.
+    """
+
+    SEGMENT_OUTPUT_NAME = "segment"
+
+    def __init__(
+        self,
+        download_node: EONode,
+        output_node: EONode,
+        path: str,
+        filesystem: FS,
+        features: Sequence[FeatureSpec],
+        compress_level: int = 1,
+    ):
+        """
+        :param download_node: Node of a task which downloads data for given `bbox` and `time_interval`
+        :param output_node: The last node of post-processing that follows the download node, or the download node
+        :param path: Folder in which the output EOPatches are saved
+        :param filesystem: Filesystem of the output folder
+        :param features: Features which are saved
+        :param compress_level: Level of compression used in saving EOPatches
+        """
+        self.download_node = download_node
+        self.segment_workflow = EOWorkflow.from_endnodes(
+            EONode(OutputTask(self.SEGMENT_OUTPUT_NAME), inputs=[output_node])
+        )
+        self.path = path
+        self.pickled_filesystem = pickle_fs(filesystem)
+        self.features = features
+        self.temporal_features = [
+            feature for feature in features if isinstance(feature, tuple) and feature[0].is_temporal()
+        ]
+        self.compress_level = compress_level
+
+    def _save(
+        self,
+        eopatch: EOPatch,
+        filesystem: FS,
+        path: str,
+        features: Sequence[FeatureSpec],
+        permission: OverwritePermission,
+    ) -> None:
+        save_task = SaveTask(
+            path=path,
+            filesystem=filesystem,
+            features=features,
+            compress_level=self.compress_level,
+            overwrite_permission=permission,
+        )
+        save_task.execute(eopatch)
+
+    def _download_segment(self, bbox: BBox, time_interval: Tuple[datetime, datetime]) -> EOPatch:
+        results = self.segment_workflow.execute({self.download_node: dict(bbox=bbox, time_interval=time_interval)})
+        return results.outputs[self.SEGMENT_OUTPUT_NAME]
+
+    def _commit_segment(self, eopatch: EOPatch, filesystem: FS, segment_path: str) -> None:
+        """Saves the data of a segment and afterwards its checkpoint"""
+        self._save(eopatch, filesystem, segment_path, self.features, OverwritePermission.OVERWRITE_PATCH)
+        self._save(eopatch, filesystem, segment_path, [FeatureType.META_INFO], OverwritePermission.OVERWRITE_FEATURES)
+
+    def _finalize(
+        self,
+        filesystem: FS,
+        eopatch_folder: str,
+        segments_folder: str,
+        n_segments: int,
+        time_period: Tuple[datetime, datetime],
+    ) -> EOPatch:
+        """Concatenates the committed segments into the output EOPatch and removes the staged segments"""
+        load_task = LoadTask(
+            path=segments_folder, filesystem=filesystem, features=[*self.features, FeatureType.META_INFO]
+        )
+        segments = [load_task.execute(eopatch_folder=get_segment_name(index)) for index in range(n_segments)]
+
+        eopatch = segments[0]
+        for feature in self.temporal_features:
+            eopatch[feature] = np.concatenate([segment[feature] for segment in segments], axis=0)
+        eopatch.timestamp = [timestamp for segment in segments for timestamp in segment.timestamp]
+
+        eopatch.meta_info[CHECKPOINT_KEY] = make_checkpoint(time_period, time_period[1])
+
+        eopatch_path = fs.path.join(self.path, eopatch_folder)
+        self._save(eopatch, filesystem, eopatch_path, self.features, OverwritePermission.OVERWRITE_FEATURES)
+        self._save(eopatch, filesystem, eopatch_path, [FeatureType.META_INFO], OverwritePermission.OVERWRITE_FEATURES)
+        filesystem.removetree(segments_folder)
+        return eopatch
+
+    def execute(
+        self,
+        *,
+        eopatch_folder: str,
+        bbox: BBox,
+        time_segments: List[Tuple[datetime, datetime]],
+        resume: bool = False,
+    ) -> EOPatch:
+        """
+        :param eopatch_folder: Name of the EOPatch folder into which the downloaded time period is saved
+        :param bbox: Bounding box of the EOPatch
+        :param time_segments: Consecutive time intervals, each of them downloaded and committed separately
+        :param resume: Whether to continue after the already committed segments or to start a new time period
+        """
+        filesystem = unpickle_fs(self.pickled_filesystem)
+        segments_folder = get_segments_folder(self.path, eopatch_folder)
+        checkpoints = load_committed_checkpoints(filesystem, segments_folder) if resume else []
+        if not checkpoints and filesystem.exists(segments_folder):
+            filesystem.removetree(segments_folder)
+
+        if checkpoints:
+            start_time = parse_time(checkpoints[0]["time_period"][0], force_datetime=True)
+        else:
+            start_time = time_segments[0][0]
+        if time_segments:
+            end_time = time_segments[-1][1]
+        else:
+            end_time = parse_time(checkpoints[-1]["committed_until"], force_datetime=True)
+        time_period = (start_time, end_time)
+
+        for index, segment in enumerate(time_segments, start=len(checkpoints)):
+            segment_eopatch = self._download_segment(bbox, segment)
+            segment_eopatch.meta_info[CHECKPOINT_KEY] = make_checkpoint(time_period, segment[1])
+            self._commit_segment(segment_eopatch, filesystem, fs.path.join(segments_folder, get_segment_name(index)))
+
+        n_segments = len(checkpoints) + len(time_segments)
+        return self._finalize(filesystem, eopatch_folder, segments_folder, n_segments, time_period)
@@ -0,0 +1,69 @@
+import datetime as dt
+import os
+import pickle
+
+import numpy as np
+import pytest
+from fs.osfs import OSFS
+
+from eogrow.core.config import interpret_config_from_path
+from eolearn.core import EONode, EOPatch, EOTask, FeatureType
+from sentinelhub import CRS, BBox
+
+from gem_example.pipelines.incremental_download import IncrementalDownloadPipeline
+from gem_example.tasks.download import SEGMENTS_FOLDER, CheckpointedDownloadTask
+
+CONFIG_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "config_files", "continuous_monitoring", "02_incremental_download.json"
+)
+
+
+class DummyDownloadTask(EOTask):
+    """Creates an EOPatch with one frame of data per day of the given time interval"""
+
+    def execute(self, *, bbox: BBox, time_interval: tuple) -> EOPatch:
+        n_days = (time_interval[1] - time_interval[0]).days + 1
+        eopatch = EOPatch(bbox=bbox)
+        eopatch.timestamp = [time_interval[0] + dt.timedelta(days=day) for day in range(n_days)]
+        eopatch[FeatureType.DATA, "NDWI"] = np.ones((n_days, 2, 2, 1), dtype=np.float32)
+        return eopatch
+
+
+@pytest.fixture(name="pipeline")
+def pipeline_fixture(tmp_path):
+    raw_config = interpret_config_from_path(CONFIG_PATH)
+    raw_config["storage"]["project_folder"] = str(tmp_path)
+    raw_config["postprocessing"] = {
+        "rescale_schemas": [{"rescale_factor": 2, "features_to_rescale": [["data", "NDWI"]]}]
+    }
+    return IncrementalDownloadPipeline.from_raw_config(raw_config)
+
+
+def test_workflow_can_be_pickled(pipeline):
+    workflow = pipeline.build_workflow(session_loader=None)
+
+    unpickled_workflow = pickle.loads(pickle.dumps(workflow))
+
+    assert [node.uid for node in unpickled_workflow.get_nodes()] == [node.uid for node in workflow.get_nodes()]
+
+
+def test_unpickled_task_commits_segments(tmp_path):
+    download_node = EONode(DummyDownloadTask())
+    task = CheckpointedDownloadTask(
+        download_node,
+        download_node,
+        path="eopatches",
+        filesystem=OSFS(str(tmp_path)),
+        features=[FeatureType.BBOX, FeatureType.TIMESTAMP, (FeatureType.DATA, "NDWI")],
+    )
+    task = pickle.loads(pickle.dumps(task))
+
+    time_segments = [
+        (dt.datetime(2022, 1, 1), dt.datetime(2022, 1, 2)),
+        (dt.datetime(2022, 1, 3), dt.datetime(2022, 1, 5)),
+    ]
+    eopatch = task.execute(eopatch_folder="patch", bbox=BBox((0, 0, 2, 2), CRS.UTM_33N), time_segments=time_segments)
+
+    assert len(eopatch.timestamp) == 5
+    assert EOPatch.load(str(tmp_path / "eopatches" / "patch"))[FeatureType.DATA, "NDWI"].shape == (5, 2, 2, 1)
+    assert os.listdir(tmp_path / "eopatches" / SEGMENTS_FOLDER) == []
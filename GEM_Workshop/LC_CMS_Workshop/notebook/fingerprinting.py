@@ -0,0 +1,341 @@
+import abc
+import hashlib
+import json
+import logging
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import fs
+import fs.errors
+import numpy as np
+from fs.base import FS
+from pydantic import Field
+
+from eogrow.core.storage import StorageManager
+from eogrow.pipelines.export_maps import ExportMapsPipeline
+from eogrow.pipelines.prediction import ClassificationPredictionPipeline
+from eogrow.utils.filter import get_patches_with_missing_features
+from eogrow.utils.types import Feature
+from eolearn.core import EONode, EOPatch, EOTask, EOWorkflow, FeatureType, OverwritePermission, SaveTask, parallelize
+from sentinelhub import CRS
+
+LOGGER = logging.getLogger()
+
+FINGERPRINT_KEY = "FINGERPRINT"
+Fingerprint = Dict[str, str]
+
+
+def hash_files(filesystem: FS, paths: Sequence[str]) -> str:
+    """
+    Calculates a hash of the content of given files, e.g. a model and its label encoder
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with filesystem.openbin(path) as file:
+            for chunk in iter(partial(file.read, 2**20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_config(config: Dict[str, Any]) -> str:
+    """
+    Calculates a hash of configuration parameters which influence the outputs
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def hash_eopatch_features(filesystem: FS, eopatch_path: str, features: Sequence[Feature]) -> str:
+    """
+    Calculates a hash of the content of EOPatch features and timestamps. The data is hashed instead of the stored files,
+    so that the hash doesn't change if the same data is saved again
+    """
+    eopatch = EOPatch.load(eopatch_path, features=[FeatureType.TIMESTAMP, *features], filesystem=filesystem)
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([timestamp.isoformat() for timestamp in eopatch.timestamp]).encode())
+    for feature in features:
+        array = eopatch[feature]
+        digest.update(f"{feature}{array.dtype}{array.shape}".encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def load_fingerprint(filesystem: FS, eopatch_path: str) -> Optional[Fingerprint]:
+    """
+    Loads the fingerprint stored in the meta-info of an EOPatch, if the EOPatch and the fingerprint exist
+    """
+    if not filesystem.exists(eopatch_path):
+        return None
+    try:
+        eopatch = EOPatch.load(eopatch_path, features=[FeatureType.META_INFO], filesystem=filesystem)
+    except OSError:
+        return None
+    return eopatch.meta_info.get(FINGERPRINT_KEY)
+
+
+class AddFingerprintTask(EOTask):
+    """
+    Stores the fingerprint of EOPatch inputs into its meta-info
+    """
+
+    def execute(self, eopatch: EOPatch, *, fingerprint: Fingerprint) -> EOPatch:
+        eopatch.meta_info[FINGERPRINT_KEY] = fingerprint
+        return eopatch
+
+
+def get_fingerprint_saving_node(path: str, filesystem: FS, previous_node: EONode) -> EONode:
+    """
+    Returns nodes which save the fingerprint after the outputs of the previous node have been saved. This way a stored
+    fingerprint always refers to completely saved outputs
+    """
+    fingerprint_node = EONode(AddFingerprintTask(), inputs=[previous_node])
+    save_task = SaveTask(
+        path,
+        filesystem=filesystem,
+        features=[FeatureType.META_INFO],
+        overwrite_permission=OverwritePermission.OVERWRITE_FEATURES,
+    )
+    return EONode(save_task, inputs=[fingerprint_node])
+
+
+class FingerprintingMixin(metaclass=abc.ABCMeta):
+    """
+    Pipeline mixin which processes only EOPatches whose inputs changed since the last run
+
+    A fingerprint, composed of hashes of input EOPatch features, hashes of other inputs and a hash of the configuration
+    that influences the outputs, is stored in the meta-info of each output EOPatch. EOPatches with a matching
+    fingerprint and all output features, as given by `_get_output_features` of the pipeline, are skipped. EOPatches
+    whose inputs can't be loaded are kept, so that their executions fail. The mixin has to precede the pipeline class
+    in the bases and the workflow has to end with the node from `_get_fingerprint_saving_node`.
+    """
+
+    config: Any
+    storage: StorageManager
+    patch_list: List[str]
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.fingerprints: Dict[str, Optional[Fingerprint]] = {}
+
+    @abc.abstractmethod
+    def _get_fingerprinted_inputs(self) -> Dict[str, Tuple[str, List[Feature]]]:
+        """Input features whose content is a part of the fingerprint, given as a mapping from a fingerprint key to a
+        pair of a storage folder key and features"""
+
+    @abc.abstractmethod
+    def _get_other_inputs_fingerprint(self) -> Fingerprint:
+        """Hashes of inputs shared by all EOPatches, e.g. a model"""
+
+    @abc.abstractmethod
+    def _get_fingerprinted_config(self) -> Dict[str, Any]:
+        """Configuration parameters which influence the outputs"""
+
+    def _hash_inputs(self, patch_name: str) -> Optional[Fingerprint]:
+        """Calculates hashes of input features of an EOPatch, or returns `None` if they can't be loaded"""
+        hashes = {}
+        for key, (folder_key, features) in self._get_fingerprinted_inputs().items():
+            eopatch_path = fs.path.join(self.storage.get_folder(folder_key), patch_name)
+            try:
+                hashes[key] = hash_eopatch_features(self.storage.filesystem, eopatch_path, features)
+            except (OSError, ValueError, fs.errors.FSError) as exception:
+                LOGGER.warning("Failed to fingerprint inputs of %s: %s", patch_name, exception)
+                return None
+        return hashes
+
+    def _calculate_fingerprints(self, patch_list: List[str]) -> None:
+        """Calculates fingerprints of the current inputs of given EOPatches"""
+        shared_fingerprint = {
+            **self._get_other_inputs_fingerprint(),
+            "config": hash_config(self._get_fingerprinted_config()),
+        }
+
+        inputs_hashes = parallelize(
+            self._hash_inputs, patch_list, workers=None, multiprocess=False, desc="Fingerprinting EOPatches"
+        )
+        for name, inputs_hash in zip(patch_list, inputs_hashes):
+            self.fingerprints[name] = None if inputs_hash is None else {**inputs_hash, **shared_fingerprint}
+
+    def filter_patch_list(self, patch_list: List[str]) -> List[str]:
+        """EOPatches are kept if their fingerprint differs from the stored one or if any output feature is missing"""
+        self._calculate_fingerprints(patch_list)
+
+        output_folder = self.storage.get_folder(self.config.output_folder_key)
+        stored_fingerprints = parallelize(
+            partial(load_fingerprint, self.storage.filesystem),
+            [fs.path.join(output_folder, name) for name in patch_list],
+            workers=None,
+            multiprocess=False,
+            desc="Loading stored fingerprints",
+        )
+        unchanged_patches = [
+            name
+            for name, stored_fingerprint in zip(patch_list, stored_fingerprints)
+            if self.fingerprints[name] is not None and stored_fingerprint == self.fingerprints[name]
+        ]
+        incomplete_patches = get_patches_with_missing_features(
+            self.storage.filesystem, output_folder, unchanged_patches, self._get_output_features()
+        )
+
+        skipped_patches = set(unchanged_patches).difference(incomplete_patches)
+        return [name for name in patch_list if name not in skipped_patches]
+
+    def _get_fingerprint_saving_node(self, previous_node: EONode) -> EONode:
+        """Returns nodes which save the fingerprint once outputs of the previous node are saved"""
+        output_folder = self.storage.get_folder(self.config.output_folder_key)
+        return get_fingerprint_saving_node(output_folder, self.storage.filesystem, previous_node)
+
+    def get_execution_arguments(self, workflow: EOWorkflow) -> List[Dict[EONode, Dict[str, object]]]:
+        exec_args = super().get_execution_arguments(workflow)
+        self._calculate_fingerprints([name for name in self.patch_list if name not in self.fingerprints])
+
+        for node in workflow.get_nodes():
+            if isinstance(node.task, AddFingerprintTask):
+                for patch_name, single_exec_dict in zip(self.patch_list, exec_args):
+                    single_exec_dict[node] = dict(fingerprint=self.fingerprints[patch_name])
+
+        return exec_args
+
+
+class FingerprintedPredictionPipeline(FingerprintingMixin, ClassificationPredictionPipeline):
+    """
+    Prediction pipeline which predicts only EOPatches whose input features, prediction mask, model or output
+    configuration changed since the last prediction, or whose predictions are incomplete
+    """
+
+    config: ClassificationPredictionPipeline.Schema
+
+    def _get_fingerprinted_inputs(self) -> Dict[str, Tuple[str, List[Feature]]]:
+        inputs = {"features": (self.config.input_folder_key, self.config.input_features)}
+        if self.config.prediction_mask_folder_key:
+            mask_feature = (FeatureType.MASK_TIMELESS, self.config.prediction_mask_feature_name)
+            inputs["prediction_mask"] = (self.config.prediction_mask_folder_key, [mask_feature])
+        return inputs
+
+    def _get_other_inputs_fingerprint(self) -> Fingerprint:
+        model_folder = self.storage.get_folder(self.config.model_folder_key)
+        filenames = [self.config.model_filename]
+        if self.config.label_encoder_filename:
+            filenames.append(self.config.label_encoder_filename)
+        paths = [fs.path.join(model_folder, filename) for filename in filenames]
+        return {"model": hash_files(self.storage.filesystem, paths)}
+
+    def _get_fingerprinted_config(self) -> Dict[str, Any]:
+        return {
+            "output_feature_name": self.config.output_feature_name,
+            "output_probability_feature_name": self.config.output_probability_feature_name,
+            "dtype": self.config.dtype,
+            "prediction_mask_folder_key": self.config.prediction_mask_folder_key,
+            "prediction_mask_feature_name": self.config.prediction_mask_feature_name,
+        }
+
+    def _get_saving_node(self, previous_node: EONode) -> EONode:
+        """Returns nodes for saving features, followed by saving of the fingerprint"""
+        return self._get_fingerprint_saving_node(super()._get_saving_node(previous_node))
+
+
+class FingerprintedExportMapsPipeline(ExportMapsPipeline):
+    """
+    Export pipeline which exports only maps whose predictions changed since the last export
+
+    Fingerprints of exported predictions, extended with a hash of the export configuration, are stored in a file in the
+    output folder. Because a merged map covers a whole UTM zone, with `skip_existing` all EOPatches of a UTM zone are
+    exported if any of their fingerprints changed or if the merged map of the zone doesn't exist, while maps of
+    unchanged UTM zones are not re-tiled and COG-ified again.
+    """
+
+    class Schema(ExportMapsPipeline.Schema):
+        skip_existing: bool = Field(False, description="Whether to skip UTM zones whose predictions didn't change")
+        fingerprints_filename: str = Field(
+            "fingerprints.json", description="Name of the file in the output folder with fingerprints of exported data"
+        )
+
+    config: Schema
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.fingerprints: Dict[str, Optional[Fingerprint]] = {}
+        self._fingerprints_path = fs.path.join(
+            self.storage.get_folder(self.config.output_folder_key), self.config.fingerprints_filename
+        )
+
+    def _load_exported_fingerprints(self) -> Dict[str, Fingerprint]:
+        if not self.storage.filesystem.exists(self._fingerprints_path):
+            return {}
+        with self.storage.filesystem.open(self._fingerprints_path, "r") as file:
+            return json.load(file)
+
+    def _save_exported_fingerprints(self, exported_fingerprints: Dict[str, Fingerprint]) -> None:
+        with self.storage.filesystem.open(self._fingerprints_path, "w") as file:
+            json.dump(exported_fingerprints, file, indent=2)
+
+    def _get_export_config(self) -> Dict[str, Any]:
+        """Configuration parameters which influence the exported maps"""
+        return {
+            "map_name": self.map_name,
+            "map_dtype": self.config.map_dtype,
+            "feature": self.config.feature,
+            "cogify": self.config.cogify,
+        }
+
+    def _merged_map_exists(self, crs: CRS) -> bool:
+        """Checks whether the merged map of a UTM zone exists, either as a single map or as per-timestamp maps"""
+        crs_output_folder = fs.path.join(self.storage.get_folder(self.config.output_folder_key), f"UTM_{crs.epsg}")
+        filesystem = self.storage.filesystem
+
+        feature_type, _ = self.config.feature
+        if feature_type.is_timeless() or not self.config.split_per_timestamp:
+            return filesystem.exists(fs.path.join(crs_output_folder, self.map_name))
+
+        return filesystem.exists(crs_output_folder) and any(
+            filesystem.exists(fs.path.join(crs_output_folder, folder, self.map_name))
+            for folder in filesystem.listdir(crs_output_folder)
+        )
+
+    def filter_patch_list(self, patch_list: List[str]) -> List[str]:
+        """EOPatches are kept if any fingerprint in their UTM zone changed or if the map of the zone is missing"""
+        input_folder = self.storage.get_folder(self.config.input_folder_key)
+        prediction_fingerprints = parallelize(
+            partial(load_fingerprint, self.storage.filesystem),
+            [fs.path.join(input_folder, name) for name in patch_list],
+            workers=None,
+            multiprocess=False,
+            desc="Loading prediction fingerprints",
+        )
+        export_hash = hash_config(self._get_export_config())
+        self.fingerprints = {
+            name: None if fingerprint is None else {**fingerprint, "export": export_hash}
+            for name, fingerprint in zip(patch_list, prediction_fingerprints)
+        }
+        exported_fingerprints = self._load_exported_fingerprints()
+
+        def is_changed(name: str) -> bool:
+            return self.fingerprints[name] is None or self.fingerprints[name] != exported_fingerprints.get(name)
+
+        changed_patches = set()
+        for crs, eopatch_list in self.eopatch_manager.split_by_utm(patch_list).items():
+            if any(map(is_changed, eopatch_list)):
+                changed_patches.update(eopatch_list)
+            elif not self._merged_map_exists(crs):
+                LOGGER.info("Map of UTM %d is missing, exporting it", crs.epsg)
+                changed_patches.update(eopatch_list)
+            else:
+                LOGGER.info("Predictions in UTM %d did not change, skipping its map", crs.epsg)
+
+        return [name for name in patch_list if name in changed_patches]
+
+    def run_procedure(self) -> Tuple[List[str], List[str]]:
+        if not self.patch_list:
+            LOGGER.info("No predictions changed since the last export")
+            return [], []
+
+        successful, failed = super().run_procedure()
+
+        if self.config.skip_existing:
+            exported_fingerprints = self._load_exported_fingerprints()
+            for name in successful:
+                fingerprint = self.fingerprints.get(name)
+                if fingerprint is not None:
+                    exported_fingerprints[name] = fingerprint
+            self._save_exported_fingerprints(exported_fingerprints)
+
+        return successful, failed
@@ -1,6 +1,6 @@
 import logging
 from functools import partial
-from typing import Any, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import fs
 import geopandas
@@ -8,6 +8,7 @@ import numpy as np
 from pydantic import Field
 
 from eogrow.core.pipeline import Pipeline
+from eogrow.utils.types import Feature, FeatureSpec
 from eolearn.core import (
     EOPatch,
     EOTask,
@@ -22,6 +23,8 @@ from eolearn.core import (
 from eolearn.core.utils.fs import pickle_fs, unpickle_fs
 from eolearn.geometry.transformations import VectorToRasterTask
 
+from fingerprinting import Fingerprint, FingerprintingMixin, hash_files
+
 LOGGER = logging.getLogger()
 
 
@@ -47,7 +50,7 @@ class LoadTrainingPolygonsForEOPatch(EOTask):
         return eopatch
 
 
-class PrepareTrainingDataPipeline(Pipeline):
+class PrepareTrainingDataPipeline(FingerprintingMixin, Pipeline):
     """
     Sample pipeline which prepares the training data
     """
@@ -74,6 +77,7 @@ class PrepareTrainingDataPipeline(Pipeline):
         self.input_bands = self.config.training_feature  # FeatureType.DATA, 'BANDS'
         self.reference_data = FeatureType.MASK_TIMELESS, "TRAINING_LABELS"
         self.train_polygons_file = fs.path.join(self.dataset_dir, "training_polygons.gpkg")
+        self._all_patch_list: Optional[List[str]] = None
 
     def build_workflow(self):
         """
@@ -111,9 +115,29 @@ class PrepareTrainingDataPipeline(Pipeline):
             config=self.sh_config,
             compress_level=self.config.compress_level,
         )
-        return EOWorkflow(
-            linearly_connect_tasks(load_features_task, load_vector_data_task, vector_to_raster_task, save_task)
-        )
+        nodes = linearly_connect_tasks(load_features_task, load_vector_data_task, vector_to_raster_task, save_task)
+
+        # Save the fingerprint of inputs only once the EO Patch is saved
+        return EOWorkflow.from_endnodes(self._get_fingerprint_saving_node(nodes[-1]))
+
+    def _get_fingerprinted_inputs(self) -> Dict[str, Tuple[str, List[Feature]]]:
+        return {"features": (self.config.input_folder_key, [self.input_bands])}
+
+    def _get_other_inputs_fingerprint(self) -> Fingerprint:
+        return {"training_polygons": hash_files(self.storage.filesystem, [self.train_polygons_file])}
+
+    def _get_fingerprinted_config(self) -> Dict[str, Any]:
+        return {"no_data_value": self.config.no_data_value}
+
+    def _get_output_features(self) -> List[FeatureSpec]:
+        return [FeatureType.BBOX, FeatureType.TIMESTAMP, self.input_bands, self.reference_data]
+
+    def filter_patch_list(self, patch_list: List[str]) -> List[str]:
+        """
+        EOPatches are filtered according to their fingerprints, but all of them are kept for consolidation
+        """
+        self._all_patch_list = patch_list
+        return super().filter_patch_list(patch_list)
 
     def run_procedure(self) -> Tuple[List[str], List[str]]:
         """
@@ -126,9 +150,11 @@ class PrepareTrainingDataPipeline(Pipeline):
 
     def consolidate_training_data_from_eopatches(self):
         """
-        This task allows consolidating the training data from all the EoPatches into a single file
+        This task allows consolidating the training data from all the EoPatches into a single file, including the ones
+        skipped because their inputs didn't change
         """
-        eopatch_paths = [f"{self._output_directory}/{name}" for name in self.patch_list]
+        patch_list = self._all_patch_list if self._all_patch_list is not None else self.patch_list
+        eopatch_paths = [f"{self._output_directory}/{name}" for name in patch_list]
         # load the data from eo-patches
         results_tuple = parallelize(
             partial(self.craft_input_features_from_eopatch, self.config.training_feature, self.reference_data),